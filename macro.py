@@ -6,17 +6,39 @@ Highlights:
 - Overwrite prompt on 'record' if the output file already exists.
 - Unified positional PATH for both 'record' and 'run' (no -i/-o flags).
 - 'play' renamed to 'run'.
-- Bottom-right overlay countdown during 'run' (default). Disable with -d none.
-- Auto-install missing dependencies (best effort), plus manual install guide below.
-- Performance: countdown runs in its own lightweight thread; event timing is not slowed down.
+- Bottom-right overlay countdown during 'run' (default). Disable with -d none; -d xlib draws it
+  with a bare X11 window (python-xlib, no Tk needed).
+- Auto-install missing dependencies (best effort; results cached in ~/.cache/macro/deps.json),
+  plus manual install guide below. System packages (tkinter) are only installed on request
+  with 'install-deps'.
+- Performance: playback owns the main thread and services the overlay between its waits
+  (no Tk mainloop, no playback worker thread); event timing is not slowed down.
 - Moves switch: -m on (default) keeps all mouse move events; -m off compacts to the last move
   before each non-move event (timing preserved).
+- Storage: compact JSON by default (--pretty indents it); a '.mcr' path selects a compact
+  gzip binary format and a '.jsonl' path JSON Lines (one event per line). 'run' detects
+  the format from the file contents. JSON I/O uses 'orjson' when installed (optional,
+  much faster on large macros).
+- Record-time move coalescing: bursts of tiny, high-rate move samples are merged into one
+  move (timing preserved). Tune the window with --coalesce-ms, disable with --raw.
 
 Manual install quick guide:
     # Core dependency (all platforms)
     python3 -m pip install --upgrade pip
     python3 -m pip install pynput
 
+    # Optional: faster JSON save/load for large macros
+    python3 -m pip install orjson
+
+    # Optional: stream large JSON macros from disk instead of loading them whole
+    python3 -m pip install ijson
+
+    # Optional: faster conversion of very large legacy ('t' based) macros
+    python3 -m pip install numpy
+
+    # Optional (Linux): single-threaded capture with 'record --source evdev'
+    python3 -m pip install evdev   # and add yourself to the 'input' group
+
     # Overlay (Tkinter) — needed for the default bottom-right dialog
     # Debian/Ubuntu:
     sudo apt-get update && sudo apt-get install -y python3-tk
@@ -32,25 +54,52 @@ Manual install quick guide:
     brew install tcl-tk   # ensure your Python uses this Tk (see brew caveats)
 
 Usage examples:
+    python3 macro.py install-deps                  # install missing deps (tkinter needs root)
     python3 macro.py record
     python3 macro.py record mymacro.json
     python3 macro.py record mymacro.json -m on     # keep all moves (default)
     python3 macro.py record mymacro.json -m off    # compact moves: keep only last move before clicks/keys
+    python3 macro.py record mymacro.json --raw     # keep every raw move sample (no coalescing)
+    python3 macro.py record mymacro.json --coalesce-ms 16  # merge moves over a wider window
+    python3 macro.py record mymacro.json -b 1000000  # preallocate room for 1M events
+    python3 macro.py record mymacro.mcr            # compact gzip binary format (~20x smaller)
+    python3 macro.py record mymacro.jsonl          # JSON Lines, streamed to disk while recording
+    python3 macro.py record mymacro.json --pretty  # indented JSON for hand editing
+    python3 macro.py record mymacro.json --source evdev  # Linux: single-thread /dev/input capture
     python3 macro.py run
     python3 macro.py run macro.json -s 1.5
+    python3 macro.py run macro.json --batch-move-ms 0  # replay every single mouse move
+    python3 macro.py run macro.json --coalesce-moves   # inject at most one move per 16 ms frame
     python3 macro.py run macro.json -d none
+    python3 macro.py run macro.json -d xlib        # lightweight X11 countdown (Linux, no Tk)
+    sudo python3 macro.py run macro.json --rt      # pinned CPU + SCHED_FIFO playback (Linux)
+    python3 macro.py run macro.json --backend xtest  # inject via X11 XTEST directly (Linux/X11)
 """
 
 import os
 import sys
 import time
 import json
+import array
+import gzip
+import mmap
+import struct
+import itertools
 import argparse
+import signal
 import subprocess
 import shutil
+import importlib.util
 from pathlib import Path
+from collections import deque
 from threading import Event, Thread
-from typing import Optional, List, Tuple
+from functools import lru_cache, partial
+from typing import Callable, Deque, Iterable, Iterator, Optional, List, Tuple
+
+try:  # optional fast JSON codec; the stdlib json module is the fallback
+    import orjson as _orjson
+except ImportError:
+    _orjson = None
 
 
 # ------------------------ Dependency management ------------------------------
@@ -58,19 +107,58 @@ from typing import Optional, List, Tuple
 def _pip_install(pkg: str) -> bool:
     """Try to install a PyPI package using pip. Returns True if success."""
     try:
-        cmd = [sys.executable, "-m", "pip", "install", "--upgrade", pkg]
-        res = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        cmd = [
+            sys.executable, "-m", "pip", "install",
+            "--quiet", "--disable-pip-version-check", "--no-input", pkg,
+        ]
+        res = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        importlib.invalidate_caches()  # let find_spec see the new package
         return res.returncode == 0
     except Exception:
         return False
 
 
-def _try_import(modname: str):
-    """Import a module by name, returning the module or None on failure."""
+def _has_module(modname: str) -> bool:
+    """
+    Return True if a module can be found, without importing (executing) it.
+    pynput in particular loads its platform backend on import, which is slow.
+    """
     try:
-        return __import__(modname)
+        return importlib.util.find_spec(modname) is not None
     except Exception:
-        return None
+        return False
+
+
+def _has_tkinter() -> bool:
+    """tkinter is pure Python and often present without its C part; probe _tkinter."""
+    return _has_module("_tkinter")
+
+
+# Optional modules found importable by earlier runs, per interpreter; lets
+# ensure_dependencies skip their probes on later runs. Delete to re-probe. pynput is
+# always re-probed (find_spec is cheap), as a stale entry would skip its auto-install.
+DEPS_CACHE_FILE = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "macro" / "deps.json"
+
+
+def _read_deps_cache() -> dict:
+    """Return the cached {module: True} map for this interpreter, or {} if absent/stale."""
+    try:
+        data = json.loads(DEPS_CACHE_FILE.read_text(encoding="utf-8"))
+    except Exception:
+        return {}
+    if not isinstance(data, dict) or data.get("py") != sys.executable:
+        return {}
+    ok = data.get("ok")
+    return dict(ok) if isinstance(ok, dict) else {}
+
+
+def _write_deps_cache(ok: dict) -> None:
+    """Best-effort write of the importable-module map for this interpreter."""
+    try:
+        DEPS_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        DEPS_CACHE_FILE.write_text(json.dumps({"py": sys.executable, "ok": ok}), encoding="utf-8")
+    except Exception:
+        pass
 
 
 def _try_install_tkinter() -> bool:
@@ -79,7 +167,7 @@ def _try_install_tkinter() -> bool:
     Returns True if tkinter import becomes available, False otherwise.
     Requires root privileges for system package managers.
     """
-    if _try_import("tkinter") is not None:
+    if _has_tkinter():
         return True
 
     # Try system package managers (Linux) if root
@@ -104,89 +192,250 @@ def _try_install_tkinter() -> bool:
                 if pre:
                     subprocess.run(pre, check=False)
                 subprocess.run(cmd, check=True)
-                return _try_import("tkinter") is not None
+                importlib.invalidate_caches()
+                return _has_tkinter()
             except Exception:
                 continue
     return False
 
 
+# In-process memo of the {module: True} map (DEPS_CACHE_FILE is read at most once)
+_DEPS_OK: Optional[dict] = None
+
+
 def ensure_dependencies(dialog_mode: str) -> str:
     """
     Ensure required modules are importable. Installs 'pynput' via pip if missing.
-    For overlay dialog mode, also ensure 'tkinter' (best effort).
+    For overlay dialog mode, also check 'tkinter'; 'xlib' mode falls back to the Tk
+    overlay when python-xlib or an X display is unavailable. System packages are
+    never installed from here (see install_dependencies / 'install-deps').
     Returns the possibly adjusted dialog mode (fallback to 'none' if Tk is unavailable).
+
+    The overlay modules found importable are remembered in DEPS_CACHE_FILE (keyed
+    on the interpreter path), so later runs skip probing them; a stale entry only
+    costs the overlay. pynput is probed every time, so a removed or rebuilt install
+    is reinstalled instead of failing on import.
     """
-    # Ensure pynput (core)
-    if _try_import("pynput") is None:
-        if not _pip_install("pynput") or _try_import("pynput") is None:
+    global _DEPS_OK
+    if _DEPS_OK is None:
+        _DEPS_OK = _read_deps_cache()
+    ok = _DEPS_OK
+    before = len(ok)
+
+    # Ensure pynput (core); never trusted from the cache
+    if not _has_module("pynput"):
+        ok.pop("pynput", None)
+        if not _pip_install("pynput") or not _has_module("pynput"):
             print("⚠️ Unable to auto-install 'pynput'. Please install it manually:\n"
                   "    python3 -m pip install pynput")
             sys.exit(1)
+    ok["pynput"] = True
+
+    # Xlib overlay: python-xlib ships with pynput on Linux; needs an X display
+    if dialog_mode == "xlib":
+        if not (sys.platform.startswith("linux") and os.environ.get("DISPLAY")
+                and (ok.get("Xlib") or _has_module("Xlib"))):
+            print("⚠️ Xlib overlay needs Linux/X11 with python-xlib; using the Tk overlay.")
+            dialog_mode = "overlay"
+        else:
+            ok["Xlib"] = True
 
     # Overlay dependencies (tkinter)
-    if dialog_mode == "overlay":
-        if _try_import("tkinter") is None and not _try_install_tkinter():
-            print("⚠️ 'tkinter' not available; disabling countdown dialog.")
+    if dialog_mode == "overlay" and not ok.get("tkinter"):
+        if not _has_tkinter():
+            print("⚠️ 'tkinter' not available; disabling countdown dialog "
+                  "(sudo python3 macro.py install-deps installs it).")
             dialog_mode = "none"
+        else:
+            ok["tkinter"] = True
 
+    if len(ok) != before:
+        _write_deps_cache(ok)
     return dialog_mode
 
 
+def install_dependencies() -> bool:
+    """
+    Explicitly install missing dependencies: 'pynput' via pip and 'tkinter' via the
+    system package manager (Linux, needs root). Returns True if both are available.
+    """
+    ok = {}
+    if _has_module("pynput") or (_pip_install("pynput") and _has_module("pynput")):
+        ok["pynput"] = True
+        print("✅ pynput available.")
+    else:
+        print("⚠️ Unable to install 'pynput'; try: python3 -m pip install pynput")
+    if _try_install_tkinter():
+        ok["tkinter"] = True
+        print("✅ tkinter available.")
+    else:
+        print("⚠️ Unable to install 'tkinter' (needs root and a supported package manager); "
+              "see the manual install guide.")
+    _write_deps_cache({**_read_deps_cache(), **ok})
+    return len(ok) == 2
+
+
 # ------------------------ Abort key configuration ----------------------------
 
 ABORT_KEY_STR = "Key.esc"   # string form for storage and comparison
 ABORT_KEY_HUMAN = "ESC"
+INJECTED_ESC_WINDOW = 0.05  # seconds an injected ESC is ignored by the abort listener
+
+_KEY_CLASS = None   # pynput.keyboard.Key, resolved once by _key_class()
+
+
+def _key_class():
+    """Return pynput's keyboard Key enum, importing it only on first use."""
+    global _KEY_CLASS
+    if _KEY_CLASS is None:
+        from pynput.keyboard import Key
+        _KEY_CLASS = Key
+    return _KEY_CLASS
+
 
 def _get_abort_key():
-    """Import and return the pynput Key object for ESC lazily."""
-    from pynput import keyboard
-    return keyboard.Key.esc
+    """Return the pynput Key object for ESC (pynput is imported lazily)."""
+    return _key_class().esc
+
+
+# ------------------------ Recorder column storage ----------------------------
+
+# Event type tags: one byte per event in the recorder's struct-of-arrays storage,
+# and the opcode of each pre-decoded playback tuple (see _compile_events)
+_T_MOVE, _T_CLICK, _T_SCROLL, _T_KEY = 0, 1, 2, 3
+
+# Record-time move coalescing: a move sample is folded into the previous stored
+# move if it arrives within this window of that move's first sample and has not
+# drifted further than this many pixels (Manhattan distance) from it.
+# The window is the default for 'record --coalesce-ms'.
+MOVE_COALESCE_DT = 0.008
+MOVE_COALESCE_PX = 3
+
+# Legacy 't' macros at least this long are converted with NumPy if installed;
+# below that, importing NumPy costs more than the plain loop
+LEGACY_NUMPY_MIN_EVENTS = 250_000
+
+# Initial recorder column capacity in events (~25 bytes each); doubled when full
+RECORD_PREALLOC = 1 << 16
+# How often the recorder's drain thread moves queued raw events into the columns
+RECORD_DRAIN_S = 0.05
+
+# Playback-time move batching: a run of back-to-back moves spanning less than this
+# much (wall-clock) time is injected as one move to its final position.
+# Default for 'run --batch-move-ms'.
+MOVE_BATCH_DT = 0.004
+# 'run --coalesce-moves' widens the window to one display frame (~60 Hz): only the
+# last position per frame can ever be seen on screen.
+MOVE_FRAME_DT = 0.016
+
+
+# ------------------------ Binary macro format --------------------------------
+#
+# Gzip-compressed; the uncompressed payload is:
+#   b"MCR1" | uint32 event count | uint32 string count
+#   string table: per entry uint16 byte length + UTF-8 bytes (entry 0 is "")
+#   fixed-size records: tag (u8), dt (f64), a (i32), b (i32), string index (u16), pressed (u8)
+# a/b hold x/y for move and click, dx/dy for scroll; the string is the button name
+# for clicks and the key string for keys. Coordinates are rounded to whole pixels.
+
+BINARY_SUFFIX = ".mcr"
+_MCR_MAGIC = b"MCR1"
+_MCR_HEADER = struct.Struct("<II")
+_MCR_STRLEN = struct.Struct("<H")
+_MCR_RECORD = struct.Struct("<BdiiH?")
+_GZIP_MAGIC = b"\x1f\x8b"
+
+# JSON Lines: one compact event object per line, written without building the whole
+# document in memory. Detected on load by a leading '{' instead of '['.
+JSONL_SUFFIX = ".jsonl"
 
 
 # ------------------------ Bottom-right Overlay -------------------------------
 
+# Runs shorter than this (after speed scaling) play without the countdown overlay
+OVERLAY_MIN_S = 2.0
+# Playback services the overlay at most this often, between its own waits
+OVERLAY_PUMP_S = 0.05
+
+_TK = None  # (tkinter, tkinter.font) once imported by _tk_modules(); False if unavailable
+
+
+def _tk_modules():
+    """Import tkinter and tkinter.font once; return (tk, tkfont), or None without Tk."""
+    global _TK
+    if _TK is None:
+        try:
+            import tkinter
+            import tkinter.font
+            _TK = (tkinter, tkinter.font)
+        except Exception:
+            _TK = False
+    return _TK or None
+
+
+def _fmt_mmss(sec: float) -> str:
+    """Format non-negative seconds as MM:SS."""
+    s = int(sec + 0.5)
+    return f"{s // 60:02d}:{s % 60:02d}"
+
+
+def _fmt_hhmmss(sec: float) -> str:
+    """Format non-negative seconds as HH:MM:SS."""
+    s = int(sec + 0.5)
+    return f"{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}"
+
+
+def _countdown_formatter(t_total: float) -> Callable[[float], str]:
+    """
+    Pick the time format once for a countdown from t_total seconds: HH:MM:SS if it
+    starts at an hour or more, else MM:SS. The remaining time only shrinks, so the
+    choice holds (and the label width stays stable) for the whole run.
+    """
+    return _fmt_hhmmss if t_total + 0.5 >= 3600 else _fmt_mmss
+
+
 class _OverlayStatus:
     """Tiny always-on-top overlay at the bottom-right that shows a countdown.
 
-    All Tk operations are confined to the main thread. Other threads only push
-    text updates onto a queue.
+    Tk never enters mainloop(): playback keeps the main thread and calls pump()
+    between its waits, which refreshes the countdown label and services one
+    round of pending Tk events (root.update()). All methods must be called from
+    the thread that called open(); without Tk or a display they do nothing.
     """
+    _PADX, _PADY = 10, 4    # label padding; the label has no border, so size is text + padding
+
     def __init__(self) -> None:
-        """Prepare overlay state; actual Tk setup is done in mainloop()."""
-        self._alive = Event()
-        self._alive.set()
-        self._text_queue: List[str] = []
-        from threading import Lock
-        self._q_lock = Lock()
+        """
+        Prepare overlay state; actual Tk setup is done in open(). tkinter is
+        imported here, before playback starts, so the import does not compete
+        with the first events.
+        """
+        self._tk = _tk_modules()
         self._root = None
         self._label = None
-
-    def update_text(self, text: str) -> None:
-        """Queue a text update for the overlay label (thread-safe)."""
-        with self._q_lock:
-            self._text_queue.append(text)
-
-    def close(self) -> None:
-        """Request closing the overlay from any thread."""
-        self._alive.clear()
-        if self._root is not None:
-            try:
-                self._root.after(0, self._root.destroy)
-            except Exception:
-                pass
-
-    def mainloop(self) -> None:
-        """Create Tk UI and enter mainloop. Must be called on the main thread."""
+        self._last_rendered: Optional[str] = None
+        self._last_size = (0, 0)
+        self._line_h = 0
+        self._font = None
+        self._screen = (0, 0)
+        self._margin = 8
+        self._t_end: Optional[float] = None   # perf_counter() deadline of the countdown
+        self._fmt: Callable[[float], str] = _fmt_mmss
+
+    def open(self, t_total: float) -> None:
+        """
+        Create the Tk window and start counting down from t_total seconds
+        (measured from now). The window is built withdrawn and only shown once
+        it is sized and placed.
+        """
+        if self._tk is None:
+            return
+        tk, tkfont = self._tk
         try:
-            import tkinter as tk
+            root = tk.Tk()
         except Exception:
-            # Tk not available; just spin until someone calls close()
-            while self._alive.is_set():
-                time.sleep(0.1)
-            return
-
-        root = tk.Tk()
-        self._root = root
+            return  # e.g. no display
+        root.withdraw()
         root.overrideredirect(True)
         try:
             root.wm_attributes("-topmost", 1)
@@ -194,57 +443,455 @@ class _OverlayStatus:
         except Exception:
             pass
 
+        self._font = tkfont.Font(root=root, family="DejaVu Sans", size=10)
         lbl = tk.Label(
             root,
             text="",
-            font=("DejaVu Sans", 10),
+            font=self._font,
             bg="#222222",
             fg="#DDDDDD",
-            padx=10,
-            pady=4,
+            padx=self._PADX,
+            pady=self._PADY,
+            bd=0,
+            highlightthickness=0,
         )
-        self._label = lbl
         lbl.pack()
+        self._root, self._label = root, lbl
 
         # Position bottom-right
-        root.update_idletasks()
-        sw = root.winfo_screenwidth()
-        sh = root.winfo_screenheight()
-        w = lbl.winfo_reqwidth()
-        h = lbl.winfo_reqheight()
-        margin = 8
-        x = max(0, sw - w - margin)
-        y = max(0, sh - h - margin)
-        root.geometry(f"{w}x{h}+{x}+{y}")
-
-        def tick():
-            if not self._alive.is_set():
-                try:
-                    root.destroy()
-                except Exception:
-                    pass
-                return
-            need_reflow = False
-            with self._q_lock:
-                if self._text_queue:
-                    text = self._text_queue[-1]
-                    self._text_queue.clear()
-                    lbl.config(text=text)
-                    need_reflow = True
-            if need_reflow:
-                root.update_idletasks()
-                nw = lbl.winfo_reqwidth()
-                nh = lbl.winfo_reqheight()
-                nx = max(0, sw - nw - margin)
-                ny = max(0, sh - nh - margin)
-                root.geometry(f"{nw}x{nh}+{nx}+{ny}")
-            root.after(250, tick)
-
-        root.after(0, tick)
+        self._screen = (root.winfo_screenwidth(), root.winfo_screenheight())
+        self._line_h = self._font.metrics("linespace")
+        self._t_end = time.perf_counter() + t_total
+        self._fmt = _countdown_formatter(t_total)
+        self.pump()
+        root.deiconify()
+        self.pump()
+
+    def pump(self) -> None:
+        """Refresh the countdown and service pending Tk events without blocking."""
+        root = self._root
+        if root is None:
+            return
+        try:
+            remaining = max(0.0, self._t_end - time.perf_counter())
+            self._apply_text("⏳ remaining " + self._fmt(remaining))
+            root.update()
+        except Exception:
+            self._root = None  # window gone (e.g. destroyed by the window manager)
+
+    def close(self) -> None:
+        """Destroy the overlay window (idempotent)."""
+        root, self._root = self._root, None
+        if root is not None:
+            try:
+                root.destroy()
+            except Exception:
+                pass
+
+    def _apply_text(self, text: str) -> None:
+        """Render text into the label and re-anchor the window."""
+        if text == self._last_rendered:
+            return
+        self._last_rendered = text
+        self._label.config(text=text)
+        self._place(self._root, self._font.measure(text) + 2 * self._PADX, self._line_h + 2 * self._PADY)
+
+    def _place(self, root, nw: int, nh: int) -> None:
+        """
+        Size the window to nw x nh and anchor it bottom-right. The size comes
+        from font metrics, so no Tk layout pass (update_idletasks) is needed;
+        the geometry is only touched when the size actually changed.
+        """
+        if (nw, nh) == self._last_size:
+            return
+        self._last_size = (nw, nh)
+        sw, sh = self._screen
+        nx = max(0, sw - nw - self._margin)
+        ny = max(0, sh - nh - self._margin)
+        root.geometry(f"{nw}x{nh}+{nx}+{ny}")
+
+
+class _XlibOverlay:
+    """Bottom-right countdown drawn in a bare override-redirect X11 window (python-xlib).
+
+    Same interface as _OverlayStatus but without the Tk widget stack: open()
+    maps the window and each pump() drains pending X events and redraws only
+    when the text changed or the window was exposed. Text is drawn with the
+    core 'fixed' font, so it is kept ASCII-only.
+    """
+    _PADX, _PADY, _MARGIN = 10, 4, 8
+
+    def __init__(self) -> None:
+        """Prepare state; the X connection is opened in open()."""
+        self._disp = None
+        self._win = None
+        self._gc = None
+        self._X = None
+        self._font = None
+        self._ascent = self._line_h = 0
+        self._screen = (0, 0)
+        self._size = (0, 0)
+        self._drawn: Optional[str] = None
+        self._t_end: Optional[float] = None   # perf_counter() deadline of the countdown
+        self._fmt: Callable[[float], str] = _fmt_mmss
+
+    def _geometry(self, text: str) -> Tuple[int, int, int, int]:
+        """Window x, y, w, h for text anchored at the bottom-right."""
+        w = self._font.query_text_extents(text).overall_width + 2 * self._PADX
+        h = self._line_h + 2 * self._PADY
+        sw, sh = self._screen
+        return max(0, sw - w - self._MARGIN), max(0, sh - h - self._MARGIN), w, h
+
+    def _current_text(self) -> str:
+        """Countdown text for the remaining time."""
+        return "remaining " + self._fmt(max(0.0, self._t_end - time.perf_counter()))
+
+    def open(self, t_total: float) -> None:
+        """Open the display, map the window and start counting down from t_total seconds."""
+        try:
+            from Xlib import X, display as xdisplay
+            disp = xdisplay.Display()
+        except Exception:
+            return  # no X connection
         try:
-            root.mainloop()
+            screen = disp.screen()
+            cmap = screen.default_colormap
+            bg = cmap.alloc_color(0x2222, 0x2222, 0x2222).pixel
+            fg = cmap.alloc_color(0xDDDD, 0xDDDD, 0xDDDD).pixel
+            self._font = font = disp.open_font("fixed")
+            info = font.query()
+            self._ascent, self._line_h = info.font_ascent, info.font_ascent + info.font_descent
+            self._screen = (screen.width_in_pixels, screen.height_in_pixels)
+            self._t_end = time.perf_counter() + t_total
+            self._fmt = _countdown_formatter(t_total)
+
+            x, y, w, h = self._geometry(self._current_text())
+            win = screen.root.create_window(
+                x, y, w, h, 0, screen.root_depth, X.InputOutput, X.CopyFromParent,
+                background_pixel=bg, override_redirect=True, event_mask=X.ExposureMask,
+            )
+            self._gc = win.create_gc(foreground=fg, background=bg, font=font)
+            win.map()
+            self._size = (w, h)
+            self._X, self._disp, self._win = X, disp, win
+        except Exception:
+            try:
+                disp.close()
+            except Exception:
+                pass
+            return
+        self.pump()
+
+    def pump(self) -> None:
+        """Handle pending X events and redraw if the countdown text changed."""
+        disp = self._disp
+        if disp is None:
+            return
+        try:
+            X, win = self._X, self._win
+            exposed = False
+            while disp.pending_events():
+                if disp.next_event().type == X.Expose:
+                    exposed = True
+            text = self._current_text()
+            if text != self._drawn or exposed:
+                x, y, w, h = self._geometry(text)
+                if (w, h) != self._size:
+                    self._size = (w, h)
+                    win.configure(x=x, y=y, width=w, height=h)
+                win.configure(stack_mode=X.Above)
+                win.clear_area()
+                win.draw_text(self._gc, self._PADX, self._PADY + self._ascent, text)
+                self._drawn = text
+            disp.flush()
+        except Exception:
+            self.close()
+
+    def close(self) -> None:
+        """Destroy the window and close the X connection (idempotent)."""
+        disp, self._disp = self._disp, None
+        if disp is None:
+            return
+        try:
+            self._win.destroy()
+            disp.flush()
         except Exception:
             pass
+        try:
+            disp.close()
+        except Exception:
+            pass
+
+
+# ------------------------ X11 XTEST playback backend -------------------------
+
+class _XTestBackend:
+    """
+    Inject playback events straight through the XTEST extension (python-xlib).
+
+    One X connection is held for the whole run and every event is a single
+    fake_input request plus a flush, skipping pynput's per-call controller logic.
+    Buttons and keys are resolved to X button numbers / keycodes once, when the
+    plan is compiled (see _compile_plan); anything that does not resolve keeps
+    using the pynput controllers.
+    """
+    _BUTTONS = {"left": 1, "middle": 2, "right": 3}
+
+    def __init__(self) -> None:
+        """Open the X display; raises if python-xlib, a display or XTEST is missing."""
+        from Xlib import X, display as xdisplay
+        from Xlib.ext import xtest
+
+        disp = xdisplay.Display()
+        if not disp.has_extension("XTEST"):
+            disp.close()
+            raise RuntimeError("X server has no XTEST extension")
+        self._disp = disp
+        self._fake = partial(xtest.fake_input, disp)
+        self._flush = disp.flush
+        self._motion = X.MotionNotify
+        self._button_ev = (X.ButtonRelease, X.ButtonPress)
+        self._key_ev = (X.KeyRelease, X.KeyPress)
+        self._keycodes: dict = {}
+
+    def move(self, x: int, y: int) -> None:
+        """Warp the pointer to (x, y) on the default screen."""
+        self._fake(self._motion, x=x, y=y)
+        self._flush()
+
+    def button(self, number: int, pressed: bool) -> None:
+        """Press or release X pointer button 'number'."""
+        self._fake(self._button_ev[pressed], number)
+        self._flush()
+
+    def key(self, keycode: int, pressed: bool) -> None:
+        """Press or release the key with X keycode 'keycode'."""
+        self._fake(self._key_ev[pressed], keycode)
+        self._flush()
+
+    def scroll(self, dx: int, dy: int) -> None:
+        """Scroll by clicking wheel buttons 4/5 (vertical) and 6/7 (horizontal)."""
+        fake = self._fake
+        press, release = self._button_ev[1], self._button_ev[0]
+        for number, steps in ((4 if dy > 0 else 5, abs(dy)), (7 if dx > 0 else 6, abs(dx))):
+            for _ in range(steps):
+                fake(press, number)
+                fake(release, number)
+        self._flush()
+
+    def button_for(self, button) -> Optional[int]:
+        """X button number for a pynput Button, or None if it has no fixed mapping."""
+        return self._BUTTONS.get(getattr(button, "name", None))
+
+    def keycode_for(self, key) -> Optional[int]:
+        """X keycode for a character or pynput Key/KeyCode (memoized), or None if unmapped."""
+        try:
+            return self._keycodes[key]
+        except KeyError:
+            pass
+        char = key if isinstance(key, str) else getattr(key, "char", None)
+        if char:
+            # Latin-1 keysyms equal the code point; others use the Unicode keysym range
+            cp = ord(char[0])
+            keysym = cp if cp < 0x100 else 0x01000000 | cp
+        else:
+            # pynput's X11 backend stores the keysym in vk (Key members wrap a KeyCode)
+            keysym = getattr(key, "vk", None) or getattr(getattr(key, "value", None), "vk", None)
+        code = None
+        if keysym:
+            try:
+                code = self._disp.keysym_to_keycode(keysym) or None
+            except Exception:
+                code = None
+        self._keycodes[key] = code
+        return code
+
+    def close(self) -> None:
+        """Close the X connection (best effort)."""
+        try:
+            self._disp.close()
+        except Exception:
+            pass
+
+
+# ------------------------ Linux evdev capture --------------------------------
+
+# evdev key names that map to pynput Key members (others are ignored unless they
+# are plain characters, see _evdev_keymap)
+_EVDEV_SPECIAL_KEYS = {
+    "KEY_ESC": "esc", "KEY_ENTER": "enter", "KEY_KPENTER": "enter", "KEY_TAB": "tab",
+    "KEY_SPACE": "space", "KEY_BACKSPACE": "backspace", "KEY_DELETE": "delete",
+    "KEY_INSERT": "insert", "KEY_HOME": "home", "KEY_END": "end",
+    "KEY_PAGEUP": "page_up", "KEY_PAGEDOWN": "page_down",
+    "KEY_UP": "up", "KEY_DOWN": "down", "KEY_LEFT": "left", "KEY_RIGHT": "right",
+    "KEY_LEFTSHIFT": "shift", "KEY_RIGHTSHIFT": "shift_r",
+    "KEY_LEFTCTRL": "ctrl", "KEY_RIGHTCTRL": "ctrl_r",
+    "KEY_LEFTALT": "alt", "KEY_RIGHTALT": "alt_gr",
+    "KEY_LEFTMETA": "cmd", "KEY_RIGHTMETA": "cmd_r",
+    "KEY_CAPSLOCK": "caps_lock", "KEY_NUMLOCK": "num_lock", "KEY_SCROLLLOCK": "scroll_lock",
+    "KEY_SYSRQ": "print_screen", "KEY_PAUSE": "pause", "KEY_COMPOSE": "menu",
+}
+_EVDEV_CHAR_KEYS = {
+    "KEY_MINUS": "-", "KEY_EQUAL": "=", "KEY_LEFTBRACE": "[", "KEY_RIGHTBRACE": "]",
+    "KEY_SEMICOLON": ";", "KEY_APOSTROPHE": "'", "KEY_GRAVE": "`", "KEY_BACKSLASH": "\\",
+    "KEY_COMMA": ",", "KEY_DOT": ".", "KEY_SLASH": "/",
+}
+
+
+def _open_evdev_devices() -> list:
+    """
+    Return readable evdev devices that emit keys or pointer motion (relative, e.g.
+    mice, or absolute, e.g. touchpads, tablets and VM pointers), or an empty list
+    if evdev is unavailable, not on Linux, or /dev/input is not readable.
+    """
+    if not sys.platform.startswith("linux"):
+        return []
+    try:
+        import evdev
+        from evdev import ecodes
+    except Exception:
+        return []
+    devices = []
+    for path in evdev.list_devices():
+        try:
+            dev = evdev.InputDevice(path)
+        except Exception:
+            continue
+        caps = dev.capabilities()
+        if ecodes.EV_KEY in caps or ecodes.EV_REL in caps or ecodes.EV_ABS in caps:
+            devices.append(dev)
+        else:
+            dev.close()
+    return devices
+
+
+def _evdev_keymap() -> dict:
+    """Build {evdev key code: pynput key} for letters, digits, punctuation and special keys."""
+    from evdev import ecodes
+    from pynput.keyboard import KeyCode
+
+    Key = _key_class()
+    keymap = {}
+    for code, names in ecodes.KEY.items():
+        for name in (names if isinstance(names, list) else [names]):
+            suffix = name[4:]
+            if name in _EVDEV_SPECIAL_KEYS:
+                key = getattr(Key, _EVDEV_SPECIAL_KEYS[name], None)
+            elif name in _EVDEV_CHAR_KEYS:
+                key = KeyCode.from_char(_EVDEV_CHAR_KEYS[name])
+            elif len(suffix) == 1 and suffix.isalnum():
+                key = KeyCode.from_char(suffix.lower())
+            elif suffix[:1] == "F" and suffix[1:].isdigit():
+                key = getattr(Key, suffix.lower(), None)
+            else:
+                key = None
+            if key is not None:
+                keymap[code] = key
+                break
+    return keymap
+
+
+def _capture_evdev(devices, stop_evt: Event, on_move, on_click, on_scroll, on_press, on_release) -> None:
+    """
+    Read all devices in one select() loop until stop_evt is set, feeding the same
+    callbacks as the pynput listeners (with pynput Button/Key objects).
+
+    evdev motion is in device units (relative mouse counts, or absolute touchpad/
+    tablet coordinates), so after each report with REL_X/REL_Y or ABS_X/ABS_Y
+    (incl. multitouch) motion the screen pointer position is queried once; this
+    keeps the display's pointer acceleration and mapping in the recording.
+    """
+    import select
+    from evdev import ecodes
+    from pynput.mouse import Controller as MouseCtl, Button
+
+    EV_KEY, EV_REL, EV_ABS, EV_SYN = ecodes.EV_KEY, ecodes.EV_REL, ecodes.EV_ABS, ecodes.EV_SYN
+    REL_X, REL_Y = ecodes.REL_X, ecodes.REL_Y
+    ABS_XY = {ecodes.ABS_X, ecodes.ABS_Y, ecodes.ABS_MT_POSITION_X, ecodes.ABS_MT_POSITION_Y}
+    REL_WHEEL, REL_HWHEEL = ecodes.REL_WHEEL, ecodes.REL_HWHEEL
+    SYN_REPORT = ecodes.SYN_REPORT
+    buttons = {ecodes.BTN_LEFT: Button.left, ecodes.BTN_RIGHT: Button.right,
+               ecodes.BTN_MIDDLE: Button.middle}
+    keymap = _evdev_keymap()
+    pointer = MouseCtl()
+    by_fd = {dev.fd: dev for dev in devices}
+    fds = list(by_fd)
+    if any(ecodes.BTN_TOOL_FINGER in dev.capabilities().get(EV_KEY, ()) for dev in devices):
+        print("⚠️ Touchpad found: tap-to-click is synthesized by libinput and never reaches "
+              "evdev, so taps are not recorded (press its buttons, or use --source pynput).")
+
+    moved = False
+    wheel_x = wheel_y = 0
+    try:
+        while not stop_evt.is_set():
+            # Short timeout only so a stop from elsewhere (e.g. SIGINT) is noticed
+            ready, _, _ = select.select(fds, [], [], 0.25)
+            for fd in ready:
+                dev = by_fd[fd]
+                try:
+                    # read() is a generator: the syscall only runs while iterating
+                    events = list(dev.read())
+                except BlockingIOError:
+                    continue
+                except OSError as e:
+                    # Device gone (e.g. unplugged: ENODEV); stop selecting on it
+                    print(f"\n⚠️ evdev device {getattr(dev, 'path', fd)} lost ({e}); ignoring it.")
+                    del by_fd[fd]
+                    fds.remove(fd)
+                    try:
+                        dev.close()
+                    except Exception:
+                        pass
+                    if not fds:
+                        print("⚠️ No evdev devices left; stopping recording.")
+                        stop_evt.set()
+                    continue
+                for ev in events:
+                    etype = ev.type
+                    if etype == EV_REL:
+                        code = ev.code
+                        if code == REL_X or code == REL_Y:
+                            moved = True
+                        elif code == REL_WHEEL:
+                            wheel_y += ev.value
+                        elif code == REL_HWHEEL:
+                            wheel_x += ev.value
+                    elif etype == EV_ABS:
+                        if ev.code in ABS_XY:
+                            moved = True
+                    elif etype == EV_SYN:
+                        if ev.code != SYN_REPORT or not (moved or wheel_x or wheel_y):
+                            continue
+                        x, y = pointer.position
+                        if moved:
+                            on_move(x, y)
+                            moved = False
+                        if wheel_x or wheel_y:
+                            on_scroll(x, y, wheel_x, wheel_y)
+                            wheel_x = wheel_y = 0
+                    elif etype == EV_KEY:
+                        btn = buttons.get(ev.code)
+                        if btn is not None:
+                            if ev.value != 2:  # ignore autorepeat for buttons
+                                x, y = pointer.position
+                                on_click(x, y, btn, bool(ev.value))
+                            continue
+                        key = keymap.get(ev.code)
+                        if key is None:
+                            continue
+                        # value 2 is autorepeat; pynput reports repeats as presses too
+                        if ev.value:
+                            on_press(key)
+                        else:
+                            on_release(key)
+                if stop_evt.is_set():
+                    break
+    finally:
+        for dev in devices:
+            try:
+                dev.close()
+            except Exception:
+                pass
 
 
 # ----------------------------- Recording -------------------------------------
@@ -252,14 +899,29 @@ class _OverlayStatus:
 def record_until_q(
     output_file: str = "macro.json",
     moves: str = "on",
+    coalesce: bool = True,
+    pretty: bool = False,
+    source: str = "pynput",
+    coalesce_ms: float = MOVE_COALESCE_DT * 1000.0,
+    buffer_size: int = RECORD_PREALLOC,
 ) -> None:
     """
     Record mouse and keyboard events and store per-event delays ("dt") until ESC is pressed.
 
     Args:
-        output_file: JSON path to write the recorded events.
+        output_file: Path to write the recorded events; JSON unless it ends in '.jsonl'
+                     (JSON Lines) or '.mcr' (compact binary format).
         moves: 'on' to store all move events (default), 'off' to compact moves so that
                only the single last move before each non-move event is kept.
+        coalesce: If True (default), merge bursts of tiny high-rate move samples
+                  (see MOVE_COALESCE_DT / MOVE_COALESCE_PX) into one move.
+        pretty: If True, indent JSON output for hand editing (default: compact JSON).
+        source: 'pynput' (default) uses one mouse and one keyboard listener thread;
+                'evdev' (Linux) reads /dev/input directly in a single select() loop and
+                falls back to pynput if no device is readable.
+        coalesce_ms: Coalescing window in milliseconds (default 8); 0 disables coalescing.
+        buffer_size: Initial event capacity of the recording columns (default
+                     RECORD_PREALLOC); columns double when it is exceeded.
     """
     from pynput import mouse, keyboard
 
@@ -269,54 +931,142 @@ def record_until_q(
             print("🚫 Recording cancelled (user declined to overwrite).")
             return
 
-    events: List[dict] = []
+    # Listener callbacks only stamp the time and append one raw tuple
+    # (tag, t, a, b, button|key, pressed) to a deque (append is atomic, so no lock);
+    # a drain thread moves them into the columns below every RECORD_DRAIN_S, doing
+    # move coalescing and key/button naming off the input threads.
+    raw: Deque[tuple] = deque()
+    raw_push = raw.append
+
+    # Struct-of-arrays storage, written only by the drain thread: preallocated
+    # typed columns (doubled when full, trimmed after recording); JSON dicts (and
+    # relative dt values) are built once after recording stops. 't' holds absolute
+    # perf_counter() stamps. 'extra' holds (button|key, pressed) for clicks and
+    # keys, in event order.
+    cap = max(1, int(buffer_size))
+    n = 0  # events stored; columns hold garbage from index n on
+    tag_col = bytearray(cap)
+    t_col = array.array("d", bytes(8 * cap))
+    a_col = array.array("d", bytes(8 * cap))   # x for move/click, dx for scroll
+    b_col = array.array("d", bytes(8 * cap))   # y for move/click, dy for scroll
+    extra: List[Tuple[str, bool]] = []
+    extra_add = extra.append
+
+    def push(tag: int, t: float, a: float, b: float) -> None:
+        """Store one event at index n, doubling the columns when full."""
+        nonlocal n, cap
+        i = n
+        if i == cap:
+            tag_col.extend(bytes(cap))
+            for col in (t_col, a_col, b_col):
+                col.frombytes(bytes(8 * cap))
+            cap *= 2
+        tag_col[i] = tag
+        t_col[i] = t
+        a_col[i] = a
+        b_col[i] = b
+        n = i + 1
+
+    key_to_str = _key_to_str
     stop_evt = Event()
-    last_abs = time.time()
+    # Monotonic, high-resolution clock; only deltas are stored so the epoch is irrelevant.
+    perf_counter = time.perf_counter
+    t_start = perf_counter()
     ABORT_KEY = _get_abort_key()
 
-    def now_abs() -> float:
-        """Return current absolute time.time() as float seconds."""
-        return time.time()
+    coalesce_dt = coalesce_ms / 1000.0
+    coalesce = coalesce and coalesce_dt > 0
+    # Time and position of the first sample folded into the last stored move
+    group_t = 0.0
+    group_x = group_y = 0.0
+    last_t = t_start
+
+    def drain() -> None:
+        """Move queued raw events into the columns, coalescing high-rate move jitter."""
+        nonlocal group_t, group_x, group_y, last_t
+        popleft = raw.popleft
+        while raw:
+            tag, t, a, b, obj, pressed = popleft()
+            # The two listener threads may enqueue a few microseconds out of order
+            if t < last_t:
+                t = last_t
+            last_t = t
+            if tag == _T_MOVE:
+                last = n - 1
+                if (
+                    coalesce
+                    and last >= 0
+                    and tag_col[last] == _T_MOVE
+                    and t - group_t < coalesce_dt
+                    and abs(a - group_x) + abs(b - group_y) < MOVE_COALESCE_PX
+                ):
+                    # Move the pending move to the latest sample's time and position
+                    t_col[last] = t
+                    a_col[last] = a
+                    b_col[last] = b
+                    continue
+                group_t, group_x, group_y = t, a, b
+            elif tag == _T_CLICK:
+                # str(button) only as a fallback: getattr() would build it on every click
+                extra_add((getattr(obj, "name", None) or str(obj).split(".")[-1], pressed))
+            elif tag == _T_KEY:
+                extra_add((key_to_str(obj), pressed))
+            push(tag, t, a, b)
+
+    # JSON Lines output with all moves kept needs no look-ahead, so it is streamed:
+    # finished rows are written as they are drained and their column space reused,
+    # keeping memory flat for arbitrarily long sessions.
+    sink = None
+    if out_path.suffix == JSONL_SUFFIX and moves == "on":
+        sink = open(out_path, "wb", buffering=1 << 20)
+    spilled = 0
+    spill_prev_t = t_start
+
+    def spill(keep_last: bool) -> None:
+        """
+        Write stored rows to the JSONL sink and shift the rest to the front. With
+        keep_last, the newest row stays, since a later move may still coalesce into it.
+        """
+        nonlocal n, spilled, spill_prev_t
+        k = n - 1 if keep_last else n
+        if k <= 0:
+            return
+        tags = tag_col[:k]
+        rows = _columns_to_events(tags, t_col[:k], a_col[:k], b_col[:k], extra, spill_prev_t)
+        sink.writelines(map(_json_dumps_line, rows))
+        del extra[:tags.count(_T_CLICK) + tags.count(_T_KEY)]
+        spill_prev_t = t_col[k - 1]
+        for col in (tag_col, t_col, a_col, b_col):
+            col[:n - k] = col[k:n]
+        n -= k
+        spilled += k
+
+    def drain_loop() -> None:
+        """Drain periodically until recording stops (the final drain runs after join)."""
+        while not stop_evt.wait(RECORD_DRAIN_S):
+            drain()
+            if sink is not None:
+                spill(keep_last=True)
 
     # Mouse callbacks
     def on_move(x, y):
-        """Record a mouse move with relative dt."""
-        nonlocal last_abs
-        cur = now_abs()
-        dt = cur - last_abs
-        last_abs = cur
-        events.append({"dt": dt, "type": "move", "x": x, "y": y})
+        """Queue a mouse move."""
+        raw_push((_T_MOVE, perf_counter(), x, y, None, False))
 
     def on_click(x, y, button, pressed):
-        """Record mouse click press/release with relative dt."""
-        nonlocal last_abs
-        cur = now_abs()
-        dt = cur - last_abs
-        last_abs = cur
-        events.append({
-            "dt": dt,
-            "type": "click",
-            "x": x,
-            "y": y,
-            "button": getattr(button, "name", str(button)).split(".")[-1],
-            "pressed": bool(pressed)
-        })
+        """Queue a mouse click press/release."""
+        raw_push((_T_CLICK, perf_counter(), x, y, button, bool(pressed)))
 
     def on_scroll(x, y, dx, dy):
-        """Record a mouse scroll with relative dt."""
-        nonlocal last_abs
-        cur = now_abs()
-        dt = cur - last_abs
-        last_abs = cur
-        events.append({"dt": dt, "type": "scroll", "dx": dx, "dy": dy})
+        """Queue a mouse scroll."""
+        raw_push((_T_SCROLL, perf_counter(), dx, dy, None, False))
 
     # Keyboard callbacks
     def on_press(key):
         """
-        Record key press with relative dt. Abort immediately when ESC is pressed;
+        Queue a key press. Abort immediately when ESC is pressed;
         do not record the abort key.
         """
-        nonlocal last_abs
         try:
             if key == ABORT_KEY:
                 print(f"⏹ Stopping recording ({ABORT_KEY_HUMAN} pressed)…")
@@ -324,39 +1074,67 @@ def record_until_q(
                 return False
         except Exception:
             pass
-        key_str = _key_to_str(key)
-        cur = now_abs()
-        dt = cur - last_abs
-        last_abs = cur
-        events.append({"dt": dt, "type": "key", "key": key_str, "pressed": True})
+        raw_push((_T_KEY, perf_counter(), 0.0, 0.0, key, True))
 
     def on_release(key):
-        """Record key release with relative dt; skip the abort key."""
+        """Queue a key release; skip the abort key."""
         if stop_evt.is_set():
             return False
-        key_str = _key_to_str(key)
-        if key_str == ABORT_KEY_STR:
+        if key == ABORT_KEY:
             return
-        nonlocal last_abs
-        cur = time.time()
-        dt = cur - last_abs
-        last_abs = cur
-        events.append({"dt": dt, "type": "key", "key": key_str, "pressed": False})
-
-    m_listener = mouse.Listener(on_move=on_move, on_click=on_click, on_scroll=on_scroll)
-    k_listener = keyboard.Listener(on_press=on_press, on_release=on_release)
-    m_listener.start()
-    k_listener.start()
+        raw_push((_T_KEY, perf_counter(), 0.0, 0.0, key, False))
 
-    print(f"🎙 Recording… Press {ABORT_KEY_HUMAN} at any time to stop.")
+    drainer = Thread(target=drain_loop, name="macro-record-drain", daemon=True)
+    drainer.start()
+    completed = False
     try:
-        while not stop_evt.is_set():
-            time.sleep(0.01)
+        devices = _open_evdev_devices() if source == "evdev" else None
+        if devices:
+            print(f"🎙 Recording via evdev ({len(devices)} devices)… "
+                  f"Press {ABORT_KEY_HUMAN} at any time to stop.")
+            _capture_evdev(devices, stop_evt, on_move, on_click, on_scroll, on_press, on_release)
+        else:
+            if source == "evdev":
+                print("⚠️ No readable evdev input devices (need 'evdev' and access to /dev/input); "
+                      "falling back to pynput listeners.")
+            m_listener = mouse.Listener(on_move=on_move, on_click=on_click, on_scroll=on_scroll)
+            k_listener = keyboard.Listener(on_press=on_press, on_release=on_release)
+            m_listener.start()
+            k_listener.start()
+
+            print(f"🎙 Recording… Press {ABORT_KEY_HUMAN} at any time to stop.")
+            try:
+                # Block until a callback sets stop_evt (ESC); no polling wakeups.
+                stop_evt.wait()
+            finally:
+                m_listener.stop()
+                k_listener.stop()
+                m_listener.join()
+                k_listener.join()
+
+        completed = True
     finally:
-        m_listener.stop()
-        k_listener.stop()
-        m_listener.join()
-        k_listener.join()
+        # Listeners are stopped; the drain thread is the only column writer, so join
+        # it before draining whatever is still queued. Also runs if capture failed,
+        # so a streamed recording is flushed and closed rather than left truncated.
+        stop_evt.set()
+        drainer.join()
+        drain()
+        if sink is not None:
+            try:
+                spill(keep_last=False)
+            finally:
+                sink.close()
+            if not completed:
+                print(f"⚠️ Recording interrupted; the {spilled} events captured so far are in {out_path}")
+
+    if sink is not None:
+        print(f"✅ Recorded {spilled} events (moves='{moves}'), streamed → {out_path}")
+        return
+
+    # Drop the unused preallocated tail
+    del tag_col[n:], t_col[n:], a_col[n:], b_col[n:]
+    events = _columns_to_events(tag_col, t_col, a_col, b_col, extra, t_start)
 
     # Optionally compact excessive mouse moves while preserving timing
     final_events = events
@@ -364,7 +1142,14 @@ def record_until_q(
         # Keep only the single last move before each non-move event
         final_events = compact_moves(events, keep_moves=1)
 
-    out_path.write_text(json.dumps(final_events, indent=2))
+    if out_path.suffix == BINARY_SUFFIX:
+        out_path.write_bytes(gzip.compress(_encode_binary(final_events), compresslevel=6))
+    elif out_path.suffix == JSONL_SUFFIX:
+        # Only reached with moves='off' (compaction needs the whole list)
+        with open(out_path, "wb") as fh:
+            fh.writelines(map(_json_dumps_line, final_events))
+    else:
+        _write_json(out_path, final_events, pretty=pretty)
     print(
         f"✅ Recorded {len(events)} raw events; wrote {len(final_events)} events "
         f"(moves='{moves}') → {out_path}"
@@ -373,77 +1158,143 @@ def record_until_q(
 
 # ------------------------------ Runner ---------------------------------------
 
+# Stop event of the run in progress; SIGINT/SIGTERM set it for a clean shutdown
+_active_stop: Optional[Event] = None
+_signals_installed = False
+
+
+def _graceful_stop(signum, frame) -> None:
+    """
+    Signal handler that requests a clean shutdown of the active run without
+    tracebacks. Outside a run, and while run_macro is still loading, SIGINT raises
+    KeyboardInterrupt and SIGTERM exits.
+    """
+    evt = _active_stop
+    if evt is not None:
+        evt.set()
+    elif signum == signal.SIGINT:
+        raise KeyboardInterrupt
+    else:
+        sys.exit(128 + signum)
+
+
+def _install_signal_handlers() -> None:
+    """
+    Install _graceful_stop for SIGINT/SIGTERM once (main thread only; best effort).
+    Called at the start of the first run_macro call, not at import, so merely
+    importing this module leaves the process's signal handling untouched.
+    """
+    global _signals_installed
+    if _signals_installed:
+        return
+    try:
+        signal.signal(signal.SIGINT, _graceful_stop)
+        signal.signal(signal.SIGTERM, _graceful_stop)
+        _signals_installed = True
+    except Exception:
+        pass
+
+
 def run_macro(
     input_file: str = "macro.json",
     speed: float = 1.0,
     dialog: str = "overlay",
     hard_exit: bool = True,
+    realtime: bool = False,
+    backend: str = "pynput",
+    batch_move_ms: float = MOVE_BATCH_DT * 1000.0,
 ) -> None:
     """
-    Run (play back) a recorded macro from JSON, with an optional bottom-right countdown.
+    Run (play back) a recorded macro, with an optional bottom-right countdown.
     On abort or finish, perform a robust teardown and (optionally) force a hard exit to
     guarantee the shell is returned even if third-party threads linger.
 
     Args:
-        input_file: Path to the JSON file.
+        input_file: Path to the macro file: JSON, JSON Lines ('.jsonl') or the gzip
+                    binary format ('.mcr'); the format is detected from the contents.
         speed: Playback speed multiplier.
-        dialog: 'overlay' (default) or 'none'.
+        dialog: 'overlay' (Tk, default), 'xlib' (bare X11 window) or 'none'.
         hard_exit: If True, terminate the process via os._exit(0) after cleanup.
+        realtime: If True, pin the playback thread to one CPU and request SCHED_FIFO
+                  (Linux; needs CAP_SYS_NICE, e.g. sudo) to reduce timing jitter.
+        backend: 'pynput' (default) injects through the pynput controllers; 'xtest'
+                 (X11) sends events directly via the XTEST extension and falls back
+                 to pynput if it is unavailable.
+        batch_move_ms: Inject runs of moves shorter than this many milliseconds of
+                       playback time as one move to the final position (default 4;
+                       0 replays every move).
     """
     from pynput.mouse import Controller as MouseCtl, Button
     from pynput.keyboard import Controller as KeyCtl, Listener as KeyListener, Key
-    import signal
 
     mouse_ctl, key_ctl = MouseCtl(), KeyCtl()
     stop_evt = Event()
-    injected_keys: set[str] = set()
+    # perf_counter() deadline until which an ESC seen by the listener is assumed to
+    # be our own injected key (a list cell so the listener closure sees updates).
+    # Self-clearing: a crashed or unreleased injected ESC cannot block real aborts.
+    suppress_esc_until = [0.0]
     ABORT_KEY = Key.esc
-    overlay: Optional[_OverlayStatus] = None
+    overlay = None  # _OverlayStatus or _XlibOverlay while a countdown is shown
 
-    # --- Graceful signal handling -------------------------------------------
-    def _graceful_stop(signum, frame):
-        """Signal handler that requests a clean shutdown without tracebacks."""
-        stop_evt.set()
-        try:
-            if overlay:
-                overlay.close()
-        except Exception:
-            pass
+    # Signal handlers go in before loading. No stop event is published until the
+    # plan is built, so until then Ctrl+C raises KeyboardInterrupt, which ends a
+    # slow load or compile below with a short message instead of a traceback.
+    _install_signal_handlers()
 
+    # The X connection is opened only once the macro has loaded; until the teardown
+    # below owns it, it is closed here if anything else fails.
+    xtest: Optional[_XTestBackend] = None
     try:
-        signal.signal(signal.SIGINT, _graceful_stop)
-        signal.signal(signal.SIGTERM, _graceful_stop)
-    except Exception:
-        pass
-
-    # Load and normalize data
-    data = json.loads(Path(input_file).read_text())
-    events_with_dt = _normalize_to_dt(data)
-    total_scaled = sum(dt for dt, _ in events_with_dt) / max(speed, 1e-6)
+        # Load, pre-decode and bind every event to a ready-to-call action
+        compiled = _load_macro(Path(input_file))
+        if batch_move_ms > 0:
+            # The window is wall-clock playback time; convert it to recorded time
+            compiled = _batch_moves(compiled, batch_move_ms / 1000.0 * max(speed, 1e-6))
+        if backend == "xtest":
+            try:
+                xtest = _XTestBackend()
+            except Exception as e:
+                print(f"⚠️ XTEST backend unavailable ({e}); using pynput.")
+        offsets, actions = _compile_plan(compiled, speed, mouse_ctl, key_ctl, suppress_esc_until, xtest)
+    except BaseException as e:
+        if xtest is not None:
+            xtest.close()
+        if not isinstance(e, KeyboardInterrupt):
+            raise
+        print(f"\n⏹ Run aborted while loading {input_file}.")
+        return
+    del compiled  # only the packed plan is needed from here on
+    total_scaled = offsets[-1] if offsets else 0.0
 
     def on_press(key):
-        """Abort the run if the user presses ESC (ignoring injected ESC events)."""
+        """
+        Abort the run if the user presses ESC (ignoring injected ESC events).
+        Called for every key the user types, so non-ESC keys cost one identity test.
+        """
         try:
-            if key == ABORT_KEY:
-                if ABORT_KEY_STR in injected_keys:
+            if key is ABORT_KEY:
+                if time.perf_counter() < suppress_esc_until[0]:
                     return
                 print(f"\n⏹ Aborting run ({ABORT_KEY_HUMAN} pressed)…")
                 stop_evt.set()
-                if overlay:
-                    overlay.close()
                 return False
         except Exception:
             pass
 
-    # Explicitly manage the keyboard listener
-    from pynput.keyboard import Listener as _KListener
-    k_listener = _KListener(on_press=on_press)
+    # Explicitly manage the keyboard listener (press only; releases need no callback)
+    k_listener = KeyListener(on_press=on_press)
     try:
         k_listener.daemon = True  # type: ignore[attr-defined]
     except Exception:
         pass
     k_listener.start()
 
+    # --- Graceful signal handling -------------------------------------------
+    # Published only now, with the plan built: the finally below always clears it,
+    # so a failed load cannot leave a dead event swallowing later Ctrl+C presses.
+    global _active_stop
+    _active_stop = stop_evt
+
     def _final_teardown() -> None:
         """Best-effort stop/join of resources; optionally hard-exit the process."""
         # Stop listener
@@ -462,6 +1313,8 @@ def run_macro(
         except Exception:
             pass
         # Help GC close low-level resources
+        if xtest is not None:
+            xtest.close()
         try:
             del mouse_ctl, key_ctl
         except Exception:
@@ -488,101 +1341,100 @@ def run_macro(
 
     try:
         def playback_loop():
-            """Execute the actual macro playback."""
-            nonlocal overlay
-            print(f"▶ Running {len(data)} events at {speed}x… (press {ABORT_KEY_HUMAN} to abort)")
+            """
+            Execute the actual macro playback on the calling (main) thread. With an
+            overlay, long waits are cut into OVERLAY_PUMP_S slices and the overlay
+            is serviced between them; Tk never runs a mainloop of its own.
+            """
+            print(f"▶ Running {len(actions)} events at {speed}x… (press {ABORT_KEY_HUMAN} to abort)")
+            if realtime:
+                _raise_playback_priority()
+
+            wait = stop_evt.wait
+            is_stopped = stop_evt.is_set
+            perf_counter = time.perf_counter
+            pump = overlay.pump if overlay else None
+            # Absolute schedule: each event fires at t0 + its precomputed offset, so
+            # time spent injecting events or waking up late never accumulates into drift.
+            t0 = perf_counter()
+            next_pump = t0 + OVERLAY_PUMP_S
             try:
-                for dt, ev in events_with_dt:
-                    if stop_evt.is_set():
-                        break
-                    scaled = dt / max(speed, 1e-6)
-                    _wait_with_abort(scaled, stop_evt)
-                    if stop_evt.is_set():
-                        break
-
-                    et = ev["type"]
-                    if et == "move":
-                        mouse_ctl.position = (ev["x"], ev["y"])
-                    elif et == "click":
-                        btn_name = ev.get("button", "left")
-                        btn = getattr(Button, btn_name, Button.left)
-                        if ev.get("pressed", True):
-                            mouse_ctl.press(btn)
-                        else:
-                            mouse_ctl.release(btn)
-                    elif et == "scroll":
-                        mouse_ctl.scroll(ev.get("dx", 0), ev.get("dy", 0))
-                    elif et == "key":
-                        key_obj = _str_to_key(ev["key"])
-                        if ev.get("key") == ABORT_KEY_STR:
-                            injected_keys.add(ABORT_KEY_STR)
-                        try:
-                            if ev.get("pressed", True):
-                                key_ctl.press(key_obj)
-                            else:
-                                key_ctl.release(key_obj)
-                        finally:
-                            if ev.get("key") == ABORT_KEY_STR and not ev.get("pressed", True):
-                                injected_keys.discard(ABORT_KEY_STR)
+                if pump is None:
+                    for at, act in zip(offsets, actions):
+                        delay = t0 + at - perf_counter()
+                        # Event.wait returns True as soon as an abort sets the event
+                        if delay > 0.0:
+                            if wait(delay):
+                                break
+                        elif is_stopped():
+                            break
+                        act()
+                else:
+                    for at, act in zip(offsets, actions):
+                        due = t0 + at
+                        now = perf_counter()
+                        # Dense bursts still service the overlay once per slice
+                        while now >= next_pump or due - now > 0.0:
+                            if now >= next_pump:
+                                pump()
+                                now = perf_counter()
+                                next_pump = now + OVERLAY_PUMP_S
+                                continue
+                            if wait(min(due, next_pump) - now):
+                                break
+                            now = perf_counter()
+                        if is_stopped():
+                            break
+                        act()
             finally:
                 stop_evt.set()
-                if overlay:
-                    overlay.close()
-
-        if dialog == "overlay" and total_scaled > 0:
-            overlay = _OverlayStatus()
-
-            def fmt_time(sec: float) -> str:
-                """Format seconds as MM:SS or HH:MM:SS if hours are present."""
-                sec = max(0, int(round(sec)))
-                h, rem = divmod(sec, 3600)
-                m, s = divmod(rem, 60)
-                return f"{h:02d}:{m:02d}:{s:02d}" if h else f"{m:02d}:{s:02d}"
-
-            def countdown_loop(t_total: float):
-                """Continuously update the overlay with remaining time until done or aborted."""
-                t0 = time.time()
-                while not stop_evt.is_set():
-                    remaining = max(0.0, t_total - (time.time() - t0))
-                    overlay.update_text(f"⏳ remaining {fmt_time(remaining)}")
-                    if remaining <= 0.0:
-                        break
-                    time.sleep(0.5)
-                if not stop_evt.is_set():
-                    overlay.update_text("⏳ remaining 00:00")
-
-            worker = Thread(target=playback_loop, daemon=True)
-            countdown_thread = Thread(target=countdown_loop, args=(total_scaled,), daemon=True)
-            worker.start()
-            countdown_thread.start()
-
-            # Tk mainloop runs on main thread; returns after overlay.close()
-            overlay.mainloop()
-
-            # Best-effort joins (non-blocking due to daemon=True)
-            try:
-                worker.join(timeout=0.5)
-                countdown_thread.join(timeout=0.5)
-            except Exception:
-                pass
 
-        else:
-            # No overlay: run playback synchronously on this thread
-            try:
-                playback_loop()
-            except KeyboardInterrupt:
-                stop_evt.set()
-                if overlay:
-                    overlay.close()
+        # Very short runs would be over before the overlay is even on screen
+        if dialog in ("overlay", "xlib") and total_scaled >= OVERLAY_MIN_S:
+            overlay = _XlibOverlay() if dialog == "xlib" else _OverlayStatus()
+            overlay.open(total_scaled)
+
+        try:
+            playback_loop()
+        except KeyboardInterrupt:
+            stop_evt.set()
+        finally:
+            if overlay:
+                overlay.close()
 
         print("✅ Run finished.")
 
     finally:
+        _active_stop = None
         _final_teardown()
 
 
 # ------------------------ Utility functions ----------------------------------
 
+def _raise_playback_priority() -> None:
+    """
+    Best effort: pin the calling thread to a single CPU and switch it to SCHED_FIFO,
+    falling back to a nice value of -5 where real-time scheduling is refused.
+    All calls act on the calling thread on Linux; failures only print a hint.
+    """
+    try:
+        # Prefer the highest-numbered CPU; CPU 0 usually services most interrupts
+        os.sched_setaffinity(0, {max(os.sched_getaffinity(0))})
+    except (AttributeError, OSError):
+        pass
+    try:
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(10))
+        return
+    except (AttributeError, OSError):
+        pass
+    try:
+        os.nice(-5)
+        print("⚠️ SCHED_FIFO unavailable; running playback at nice -5 instead.")
+    except (AttributeError, OSError):
+        print("⚠️ Real-time scheduling unavailable (needs Linux and CAP_SYS_NICE, e.g. sudo); "
+              "continuing with normal priority.")
+
+
 def _confirm_overwrite(path: Path) -> bool:
     """Prompt the user to confirm overwriting an existing file. Returns True if confirmed."""
     while True:
@@ -598,60 +1450,416 @@ def _confirm_overwrite(path: Path) -> bool:
 
 
 def _key_to_str(key) -> str:
-    """Convert pynput key object to a compact string representation."""
-    try:
-        if hasattr(key, "char") and key.char is not None:
-            return key.char
-    except Exception:
-        pass
-    return str(key)  # e.g., 'Key.enter' or 'Key.esc'
+    """
+    Convert pynput key object to a compact string representation: the character
+    for KeyCodes, 'Key.<name>' (e.g. 'Key.enter') for Key members, else str(key).
+    Built from attributes directly instead of going through Enum.__str__.
+    """
+    c = getattr(key, "char", None)
+    if c is not None:
+        return c
+    name = getattr(key, "name", None)
+    if name is not None:
+        return "Key." + name
+    return str(key)  # e.g. a KeyCode with only a virtual key code
 
 
+@lru_cache(maxsize=256)
 def _str_to_key(s: str):
-    """Convert stored key string back to a pynput key or character."""
-    from pynput.keyboard import Key
+    """Convert stored key string back to a pynput key or character (memoized)."""
     if s.startswith("Key."):
         name = s.split(".", 1)[1]
-        return getattr(Key, name, s)
+        return getattr(_key_class(), name, s)
     if len(s) == 1:
         return s
     return s
 
 
+@lru_cache(maxsize=32)
+def _button_for(name: str):
+    """Resolve a stored button name to a pynput Button, defaulting to left (memoized)."""
+    from pynput.mouse import Button
+    return getattr(Button, name, Button.left)
+
+
+def _num(v: float):
+    """Return a stored coordinate as int when integral, keeping JSON output like '397'."""
+    return int(v) if v.is_integer() else v
+
+
+def _columns_to_events(
+    tags: bytearray,
+    times: "array.array[float]",
+    a_vals: "array.array[float]",
+    b_vals: "array.array[float]",
+    extra: List[Tuple[str, bool]],
+    t_start: float,
+) -> List[dict]:
+    """
+    Zip the recorder's struct-of-arrays columns back into JSON-ready event dicts.
+
+    'times' holds absolute timestamps; each event's dt is the gap to the previous
+    event (or to t_start for the first). Clicks and keys consume the next
+    (name, pressed) entry of 'extra' in order.
+    """
+    events: List[dict] = []
+    append = events.append
+    next_extra = iter(extra).__next__
+    prev = t_start
+    for tag, t, a, b in zip(tags, times, a_vals, b_vals):
+        dt = t - prev
+        prev = t
+        if tag == _T_MOVE:
+            append({"dt": dt, "type": "move", "x": _num(a), "y": _num(b)})
+        elif tag == _T_CLICK:
+            button, pressed = next_extra()
+            append({
+                "dt": dt,
+                "type": "click",
+                "x": _num(a),
+                "y": _num(b),
+                "button": button,
+                "pressed": pressed
+            })
+        elif tag == _T_SCROLL:
+            append({"dt": dt, "type": "scroll", "dx": _num(a), "dy": _num(b)})
+        else:
+            key, pressed = next_extra()
+            append({"dt": dt, "type": "key", "key": key, "pressed": pressed})
+    return events
+
+
 def _normalize_to_dt(data: List[dict]) -> List[Tuple[float, dict]]:
     """
     Convert a loaded JSON event list into a list of (dt, event) tuples.
 
     Supports legacy formats that had absolute 't' times by converting them
-    into relative 'dt' between events.
-    """
-    result: List[Tuple[float, dict]] = []
-    if not data:
-        return result
-    if "dt" in data[0]:
-        for ev in data:
-            result.append((max(0.0, float(ev.get("dt", 0.0))), ev))
-        return result
+    into relative 'dt' between events; for large legacy lists this is done
+    with NumPy when it is installed (optional).
+    """
+    if len(data) >= LEGACY_NUMPY_MIN_EVENTS and "dt" not in data[0]:
+        dts = _legacy_dts_numpy(data)
+        if dts is not None:
+            return list(zip(dts, data))
+    return list(_iter_with_dt(data))
+
+
+def _legacy_dts_numpy(data: List[dict]) -> Optional[List[float]]:
+    """
+    Vectorized legacy 't' -> 'dt' conversion (same result as _iter_with_dt).
+    Returns None if NumPy is unavailable or a 't' value is not numeric.
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        return None
+    try:
+        ts = np.fromiter((ev.get("t", np.nan) for ev in data), dtype=np.float64, count=len(data))
+    except (TypeError, ValueError):
+        return None
+    missing = np.isnan(ts)
+    if missing.any():
+        # A missing 't' repeats the previous timestamp (dt 0); 0.0 before the first one
+        idx = np.where(missing, 0, np.arange(1, len(ts) + 1))
+        np.maximum.accumulate(idx, out=idx)
+        ts = np.concatenate(([0.0], ts))[idx]
+    dts = np.diff(ts, prepend=0.0)
+    np.maximum(dts, 0.0, out=dts)
+    return dts.tolist()
+
+
+def _iter_with_dt(events: Iterable[dict]) -> Iterator[Tuple[float, dict]]:
+    """
+    Lazily yield (dt, event) pairs from any event iterable (list or streaming parser).
+    The format is decided by the first event: 'dt' based, or legacy absolute 't'.
+    """
+    it = iter(events)
+    first = next(it, None)
+    if first is None:
+        return
+    if "dt" in first:
+        yield max(0.0, float(first.get("dt", 0.0))), first
+        for ev in it:
+            yield max(0.0, float(ev.get("dt", 0.0))), ev
+        return
+    # Legacy absolute 't'; the event dicts are passed through as-is (only the
+    # yielded dt is used downstream), so no per-event copy is made.
     prev_t = 0.0
-    for ev in data:
+    for ev in itertools.chain((first,), it):
         t = float(ev.get("t", prev_t))
         dt = max(0.0, t - prev_t)
         prev_t = t
-        ev2 = dict(ev)
-        ev2.pop("t", None)
-        ev2["dt"] = dt
-        result.append((dt, ev2))
-    return result
+        yield dt, ev
+
+
+def _batch_moves(compiled: List[tuple], window: float) -> List[tuple]:
+    """
+    Merge runs of consecutive move tuples spanning less than 'window' seconds
+    (recorded time) into the run's last move, carrying the summed dt, so only the
+    final position of each sub-frame burst is injected. Other events are untouched.
+    """
+    out: List[tuple] = []
+    append = out.append
+    span = 0.0  # recorded time from the first move of the current run
+    for ev in compiled:
+        if ev[0] == _T_MOVE and out and out[-1][0] == _T_MOVE and span + ev[1] < window:
+            span += ev[1]
+            out[-1] = (_T_MOVE, out[-1][1] + ev[1], ev[2], ev[3], False)
+        else:
+            append(ev)
+            span = 0.0
+    return out
+
+
+def _compile_events(events_with_dt: Iterable[Tuple[float, dict]]) -> List[tuple]:
+    """
+    Pre-decode (dt, event) pairs into flat playback tuples (op, dt, a, b, is_abort).
+
+    All dict lookups, button/key resolution and ESC detection happen here once,
+    so the playback loop only branches on a small integer opcode:
+
+        (_T_MOVE,   dt, x,       y,       False)
+        (_T_CLICK,  dt, button,  pressed, False)
+        (_T_SCROLL, dt, dx,      dy,      False)
+        (_T_KEY,    dt, key_obj, pressed, is_abort)
+
+    Events of unknown type are dropped; their delay is carried over to the next
+    event so overall timing is unchanged.
+    """
+    button_for, str_to_key = _button_for, _str_to_key
+    out: List[tuple] = []
+    append = out.append
+    carry = 0.0
+    for dt, ev in events_with_dt:
+        dt += carry
+        carry = 0.0
+        et = ev.get("type")
+        if et == "move":
+            append((_T_MOVE, dt, ev["x"], ev["y"], False))
+        elif et == "click":
+            btn = button_for(ev.get("button", "left"))
+            append((_T_CLICK, dt, btn, bool(ev.get("pressed", True)), False))
+        elif et == "scroll":
+            append((_T_SCROLL, dt, ev.get("dx", 0), ev.get("dy", 0), False))
+        elif et == "key":
+            name = ev["key"]
+            append((_T_KEY, dt, str_to_key(name), bool(ev.get("pressed", True)), name == ABORT_KEY_STR))
+        else:
+            carry = dt
+    return out
+
+
+def _load_macro(path: Path) -> List[tuple]:
+    """
+    Load a JSON, JSON Lines or binary macro file and return pre-decoded playback tuples.
+
+    With ijson's C backend installed, JSON is streamed from a read-only mmap and
+    each event dict is compiled and dropped as soon as it is parsed, so neither the
+    file text nor the full list of dicts is ever held in memory.
+    """
+    with open(path, "rb") as fh:
+        head = fh.read(2)
+        if head == _GZIP_MAGIC:
+            return _decode_binary(gzip.decompress(head + fh.read()))
+        fh.seek(0)
+        if fh.read(64).lstrip()[:1] == b"{":
+            # JSON Lines: parse one event per line
+            fh.seek(0)
+            return _compile_events(_iter_with_dt(_json_loads(line) for line in fh if line.strip()))
+        ijson = _streaming_json()
+        if ijson is not None and os.fstat(fh.fileno()).st_size > 0:
+            with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return _compile_events(_iter_with_dt(ijson.items(mm, "item", use_float=True)))
+        fh.seek(0)
+        raw = fh.read()
+    return _compile_events(_normalize_to_dt(_json_loads(raw)))
+
+
+def _streaming_json():
+    """
+    Return the ijson module if its C (yajl2_c) backend is available, else None.
+    The pure-Python ijson backends are slower than a plain json.loads.
+    """
+    try:
+        import ijson
+    except ImportError:
+        return None
+    return ijson if getattr(ijson, "backend", "") == "yajl2_c" else None
+
+
+def _write_json(path: Path, obj, pretty: bool = False) -> None:
+    """
+    Write obj to path as UTF-8 JSON, compact unless 'pretty'. orjson (if installed)
+    serializes in one C call; the stdlib fallback streams chunks into the file
+    instead of building the whole document as one string first.
+    """
+    if _orjson is not None:
+        path.write_bytes(_orjson.dumps(obj, option=_orjson.OPT_INDENT_2 if pretty else 0))
+        return
+    with open(path, "w", encoding="utf-8") as fh:
+        if pretty:
+            json.dump(obj, fh, indent=2)
+        else:
+            json.dump(obj, fh, separators=(",", ":"))
+
+
+def _json_dumps_line(obj) -> bytes:
+    """Serialize one compact JSON Lines record, newline included (orjson appends it in C)."""
+    if _orjson is not None:
+        return _orjson.dumps(obj, option=_orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(obj, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def _json_loads(raw: bytes):
+    """Parse JSON from bytes (orjson if installed, else the stdlib)."""
+    if _orjson is not None:
+        return _orjson.loads(raw)
+    return json.loads(raw)
+
+
+def _encode_binary(events: List[dict]) -> bytes:
+    """Pack recorded event dicts into the uncompressed binary payload (see BINARY_SUFFIX)."""
+    strings: List[str] = [""]
+    index = {"": 0}
+    body = bytearray()
+    pack = _MCR_RECORD.pack
+    count = 0
+    carry = 0.0
+    for ev in events:
+        dt = float(ev.get("dt", 0.0)) + carry
+        carry = 0.0
+        et = ev.get("type")
+        if et == "move":
+            tag, a, b, name, pressed = _T_MOVE, ev["x"], ev["y"], "", False
+        elif et == "click":
+            tag, a, b = _T_CLICK, ev["x"], ev["y"]
+            name, pressed = ev.get("button", "left"), ev.get("pressed", True)
+        elif et == "scroll":
+            tag, a, b, name, pressed = _T_SCROLL, ev.get("dx", 0), ev.get("dy", 0), "", False
+        elif et == "key":
+            tag, a, b, name, pressed = _T_KEY, 0, 0, ev["key"], ev.get("pressed", True)
+        else:
+            carry = dt
+            continue
+        si = index.get(name)
+        if si is None:
+            si = index[name] = len(strings)
+            strings.append(name)
+        body += pack(tag, dt, int(round(a)), int(round(b)), si, bool(pressed))
+        count += 1
+
+    head = bytearray(_MCR_MAGIC)
+    head += _MCR_HEADER.pack(count, len(strings))
+    for name in strings:
+        encoded = name.encode("utf-8")
+        head += _MCR_STRLEN.pack(len(encoded))
+        head += encoded
+    return bytes(head + body)
+
+
+def _decode_binary(buf: bytes) -> List[tuple]:
+    """
+    Unpack a binary payload straight into playback tuples (see _compile_events),
+    without building intermediate event dicts.
+    """
+    if buf[:4] != _MCR_MAGIC:
+        raise ValueError("not a binary macro file (bad magic)")
+    count, n_strings = _MCR_HEADER.unpack_from(buf, 4)
+    off = 4 + _MCR_HEADER.size
+    strings: List[str] = []
+    for _ in range(n_strings):
+        (length,) = _MCR_STRLEN.unpack_from(buf, off)
+        off += _MCR_STRLEN.size
+        strings.append(buf[off:off + length].decode("utf-8"))
+        off += length
+
+    button_for, str_to_key = _button_for, _str_to_key
+    out: List[tuple] = []
+    append = out.append
+    records = memoryview(buf)[off:off + count * _MCR_RECORD.size]
+    # iter_unpack walks the fixed-size records at C speed without copying the buffer
+    for tag, dt, a, b, si, pressed in _MCR_RECORD.iter_unpack(records):
+        if tag == _T_CLICK:
+            append((_T_CLICK, dt, button_for(strings[si]), pressed, False))
+        elif tag == _T_KEY:
+            name = strings[si]
+            append((_T_KEY, dt, str_to_key(name), pressed, name == ABORT_KEY_STR))
+        else:
+            append((tag, dt, a, b, False))
+    return out
 
 
-def _wait_with_abort(seconds: float, stop_evt: Event) -> None:
-    """Wait up to 'seconds' in small increments, returning early if stop_evt is set."""
-    end = time.time() + max(0.0, seconds)
-    while not stop_evt.is_set():
-        remaining = end - time.time()
-        if remaining <= 0:
-            break
-        time.sleep(min(remaining, 0.005))
+def _compile_plan(
+    compiled: List[tuple],
+    speed: float,
+    mouse_ctl,
+    key_ctl,
+    suppress_esc_until: List[float],
+    xtest: Optional[_XTestBackend] = None,
+) -> Tuple["array.array[float]", List[Callable[[], None]]]:
+    """
+    Partially evaluate pre-decoded events into parallel (offsets, actions) columns.
+
+    Each action is a zero-argument callable already bound to its controller method
+    and arguments (mostly functools.partial, so the call stays in C). The offset is
+    the event's absolute time from playback start, already divided by the speed
+    (a running sum of the scaled dt values), so the playback loop only waits and calls.
+    Offsets are packed into a float array and identical actions (same key, button or
+    position) share one callable, which keeps large macros compact in memory.
+    An injected ESC also pushes suppress_esc_until[0] forward by
+    INJECTED_ESC_WINDOW so the abort listener ignores it.
+
+    With an XTEST backend, actions call it with pre-resolved integer coordinates,
+    button numbers and keycodes; buttons/keys it cannot map stay on pynput.
+    """
+    inv_speed = 1.0 / max(speed, 1e-6)
+    mouse_press, mouse_release, mouse_scroll = mouse_ctl.press, mouse_ctl.release, mouse_ctl.scroll
+    key_press, key_release = key_ctl.press, key_ctl.release
+    perf_counter = time.perf_counter
+
+    def injected_esc(inject):
+        """Wrap an ESC press/release action so the abort listener is told about it first."""
+        def act():
+            suppress_esc_until[0] = perf_counter() + INJECTED_ESC_WINDOW
+            inject()
+        return act
+
+    acts: List[Callable[[], None]] = []
+    append = acts.append
+    interned: dict = {}
+    for op, _dt, a, b, is_abort in compiled:
+        act = interned.get((op, a, b, is_abort))
+        if act is not None:
+            append(act)
+            continue
+        if op == _T_MOVE:
+            if xtest is not None:
+                act = partial(xtest.move, int(a), int(b))
+            else:
+                act = partial(setattr, mouse_ctl, "position", (a, b))
+        elif op == _T_CLICK:
+            number = xtest.button_for(a) if xtest is not None else None
+            if number is not None:
+                act = partial(xtest.button, number, b)
+            else:
+                act = partial(mouse_press if b else mouse_release, a)
+        elif op == _T_SCROLL:
+            if xtest is not None:
+                act = partial(xtest.scroll, int(a), int(b))
+            else:
+                act = partial(mouse_scroll, a, b)
+        else:
+            keycode = xtest.keycode_for(a) if xtest is not None else None
+            if keycode is not None:
+                act = partial(xtest.key, keycode, b)
+            else:
+                act = partial(key_press if b else key_release, a)
+            if is_abort:
+                act = injected_esc(act)
+        interned[(op, a, b, is_abort)] = act
+        append(act)
+    offsets = array.array("d", itertools.accumulate(ev[1] * inv_speed for ev in compiled))
+    return offsets, acts
 
 
 def compact_moves(events: List[dict], keep_moves: int = 1) -> List[dict]:
@@ -664,49 +1872,41 @@ def compact_moves(events: List[dict], keep_moves: int = 1) -> List[dict]:
     With keep_moves=1 this results in exactly one move (the last) before each non-move.
 
     Args:
-        events: Original event list (must have 'dt' per event).
+        events: Original event list (must have 'dt' and 'type' per event).
         keep_moves: Number of trailing move events to retain before each non-move (default 1).
 
     Returns:
         A new list of events with fewer 'move' entries but identical cumulative timing
         for all non-move events (click/key/scroll) and thus preserved key press durations.
+        The event dicts are reused, not copied; folded delays are added to their 'dt'
+        in place.
     """
     if keep_moves is None or keep_moves < 0:
         keep_moves = 1
 
     out: List[dict] = []
+    append = out.append
     move_buf: List[dict] = []
 
     def flush_moves_before(next_event: Optional[dict]) -> None:
         """Flush the buffered moves, keeping only the last N and preserving total dt."""
-        nonlocal out, move_buf
         if not move_buf:
             return
-        total_dt = sum(float(ev.get("dt", 0.0)) for ev in move_buf)
-        kept = move_buf[-keep_moves:] if keep_moves > 0 else []
-        dropped = move_buf[:-keep_moves] if keep_moves > 0 else move_buf
-        dropped_dt = sum(float(ev.get("dt", 0.0)) for ev in dropped)
-
-        if kept:
-            kept_first = dict(kept[0])
-            kept_first["dt"] = float(kept_first.get("dt", 0.0)) + dropped_dt
-            out.extend([kept_first, *kept[1:]])
-        else:
-            if next_event is not None:
-                next_event["dt"] = float(next_event.get("dt", 0.0)) + total_dt
-            else:
-                # End-of-stream idle time does not affect playback; drop it.
-                pass
+        if keep_moves > 0:
+            kept = move_buf[-keep_moves:]
+            kept[0]["dt"] += sum(ev["dt"] for ev in move_buf[:-keep_moves])
+            out.extend(kept)
+        elif next_event is not None:
+            next_event["dt"] += sum(ev["dt"] for ev in move_buf)
+        # else: end-of-stream idle time does not affect playback; drop it.
         move_buf.clear()
 
     for ev in events:
-        et = ev.get("type")
-        if et == "move":
-            move_buf.append(dict(ev))
+        if ev["type"] == "move":
+            move_buf.append(ev)
             continue
-        ev_copy = dict(ev)
-        flush_moves_before(ev_copy)
-        out.append(ev_copy)
+        flush_moves_before(ev)
+        append(ev)
 
     flush_moves_before(next_event=None)
     return out
@@ -720,22 +1920,93 @@ def _build_argparser():
     sub = p.add_subparsers(dest="cmd", required=True)
 
     r = sub.add_parser("record", help=f"Record until you press {ABORT_KEY_HUMAN}.")
-    r.add_argument("path", nargs="?", default="macro.json", help="Output JSON path.")
+    r.add_argument(
+        "path", nargs="?", default="macro.json",
+        help=(
+            f"Output path (JSON; a '{JSONL_SUFFIX}' suffix writes one event per line, "
+            f"'{BINARY_SUFFIX}' the compact binary format)."
+        ),
+    )
     r.add_argument(
         "-m", "--moves",
         choices=("on", "off"),
         default="on",
         help="Mouse move recording: 'on' keeps all moves (default), 'off' compacts to the last move before each non-move."
     )
+    r.add_argument(
+        "--pretty",
+        action="store_true",
+        help="Write indented JSON for hand editing (default: compact JSON).",
+    )
+    r.add_argument(
+        "--source",
+        choices=("pynput", "evdev"),
+        default="pynput",
+        help="Input source: pynput listeners (default) or, on Linux, a single evdev reader "
+             "over /dev/input (needs the 'evdev' package and read access, e.g. the 'input' group).",
+    )
+    r.add_argument(
+        "--raw",
+        dest="coalesce",
+        action="store_false",
+        help="Keep every raw move sample (disable record-time coalescing of tiny, high-rate moves).",
+    )
+    r.add_argument(
+        "--coalesce-ms",
+        type=float,
+        default=MOVE_COALESCE_DT * 1000.0,
+        help="Move coalescing window in milliseconds (default: %(default)g; 0 disables).",
+    )
+    r.add_argument(
+        "-b", "--buffer",
+        type=int,
+        default=RECORD_PREALLOC,
+        help="Preallocated event capacity (default: %(default)d); grows by doubling "
+             "when exceeded, so size it for long recordings to avoid resizes.",
+    )
+
+    sub.add_parser(
+        "install-deps",
+        help="Install missing dependencies (pynput via pip; tkinter via the system package manager, needs root).",
+    )
 
     rn = sub.add_parser("run", help="Run a recorded macro from JSON.")
-    rn.add_argument("path", nargs="?", default="macro.json", help="Input JSON path.")
+    rn.add_argument("path", nargs="?", default="macro.json", help="Input macro path (JSON, JSON Lines or binary).")
     rn.add_argument("-s", "--speed", type=float, default=1.0, help="Run speed multiplier.")
     rn.add_argument(
         "-d", "--dialog",
-        choices=("overlay", "none"),
+        choices=("overlay", "xlib", "none"),
         default="overlay",
-        help="Countdown display: overlay (default) or none."
+        help="Countdown display: overlay (Tk, default), xlib (lightweight bare X11 window, Linux) or none."
+    )
+    rn.add_argument(
+        "--rt", "--realtime",
+        dest="realtime",
+        action="store_true",
+        help="Pin playback to one CPU and use SCHED_FIFO (or nice -5) for lower jitter "
+             "(Linux; needs sudo/CAP_SYS_NICE).",
+    )
+    rn.add_argument(
+        "--batch-move-ms",
+        type=float,
+        default=MOVE_BATCH_DT * 1000.0,
+        help="Inject bursts of moves shorter than this many ms as one move "
+             "(default: %(default)g; 0 replays every move).",
+    )
+    rn.add_argument(
+        "--coalesce-moves",
+        dest="batch_move_ms",
+        action="store_const",
+        const=MOVE_FRAME_DT * 1000.0,
+        default=MOVE_BATCH_DT * 1000.0,
+        help="Inject at most one move per display frame (same as --batch-move-ms %g)." % (MOVE_FRAME_DT * 1000.0),
+    )
+    rn.add_argument(
+        "--backend",
+        choices=("pynput", "xtest"),
+        default="pynput",
+        help="Event injection: pynput controllers (default) or xtest, direct X11 XTEST "
+             "requests over one connection (Linux/X11; falls back to pynput).",
     )
     rn.add_argument(
         "--no-hard-exit",
@@ -751,16 +2022,32 @@ def main():
     """Entry point for the command-line interface."""
     args = _build_argparser().parse_args()
 
+    if args.cmd == "install-deps":
+        sys.exit(0 if install_dependencies() else 1)
+
     if args.cmd == "record":
         _ = ensure_dependencies("none")  # only pynput
         record_until_q(
             output_file=args.path,
             moves=args.moves,
+            coalesce=args.coalesce,
+            pretty=args.pretty,
+            source=args.source,
+            coalesce_ms=args.coalesce_ms,
+            buffer_size=args.buffer,
         )
 
     elif args.cmd == "run":
         dialog_mode = ensure_dependencies(args.dialog)
-        run_macro(input_file=args.path, speed=args.speed, dialog=dialog_mode, hard_exit=args.hard_exit)
+        run_macro(
+            input_file=args.path,
+            speed=args.speed,
+            dialog=dialog_mode,
+            hard_exit=args.hard_exit,
+            realtime=args.realtime,
+            backend=args.backend,
+            batch_move_ms=args.batch_move_ms,
+        )
 
 
 if __name__ == "__main__":